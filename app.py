@@ -1,6 +1,11 @@
 import streamlit as st
 import os
+import time
+import logging
+import queue
+import threading
 from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, ConfigurationError
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -9,70 +14,142 @@ load_dotenv()
 
 # Import from lib
 from config import get_mongodb_uri
-from query_processor import process_bot_query
+from query_processor import process_bot_query, clear_answer_cache
 
-# MongoDB connection with proper error handling
-def get_mongodb_client():
+logger = logging.getLogger(__name__)
+
+def _ensure_indexes(client):
+    """Ensure the indexes the app queries by - run off the request path"""
+    # bot_id lookups must be an index seek, not a collection scan
     try:
-        mongodb_uri = get_mongodb_uri()
-        if not mongodb_uri:
-            st.error("MongoDB URI not found. Please check your environment variables.")
-            return None
-        
-        client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-        # Test connection
-        client.admin.command('ping')
-        print("✅ MongoDB connection successful")
-        return client
+        client.chatbot_builder.chatbots.create_index([('bot_id', 1)], unique=True)
     except Exception as e:
-        print(f"❌ MongoDB connection failed: {e}")
-        st.error(f"MongoDB connection failed: {str(e)}")
-        return None
+        logger.warning("⚠️ Could not ensure chatbots.bot_id index: %s", e)
+
+@st.cache_resource(show_spinner=False)
+def _mongo():
+    """Cached MongoDB client - PyMongo pools connections internally, so share one per process.
+    Index creation runs once per process in a background thread, so an unreachable
+    server or a read-only user never delays the first request."""
+    mongodb_uri = get_mongodb_uri()
+    if not mongodb_uri:
+        raise ConfigurationError("MONGODB_URI not found")
+    client = MongoClient(
+        mongodb_uri,
+        maxPoolSize=50,
+        minPoolSize=5,
+        serverSelectionTimeoutMS=5000
+    )
+    threading.Thread(target=_ensure_indexes, args=(client,), daemon=True).start()
+    return client
+
+# Only the fields this app reads
+BOT_CONFIG_PROJECTION = {
+    '_id': 0,
+    'bot_id': 1,
+    'name': 1,
+    'description': 1,
+    'welcome_message': 1,
+    'system_prompt': 1,
+    'temperature': 1,
+    'user_id': 1,
+    'is_active': 1
+}
+
+class BotNotFound(Exception):
+    """Raised by _load_bot_config on a miss so Streamlit doesn't cache it"""
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_bot_config(bot_id):
+    """Fetch bot configuration from MongoDB - cached for 5 minutes per bot.
+    Errors and misses are raised (not cached) so a DB hiccup or a bot created
+    moments later doesn't stick for the whole TTL."""
+    db = _mongo().chatbot_builder
+    logger.debug("🔍 Searching for bot_id: %s", bot_id)
+    
+    # Get the specific bot
+    bot_config = db.chatbots.find_one({'bot_id': bot_id}, projection=BOT_CONFIG_PROJECTION)
+    logger.debug("✅ Bot found: %s", bot_config is not None)
+    
+    if bot_config is None:
+        raise BotNotFound(bot_id)
+    return bot_config
 
 def get_bot_config(bot_id):
-    """Get bot configuration from MongoDB"""
+    """Get bot configuration (cached). Connection/configuration errors are raised."""
     try:
-        client = get_mongodb_client()
-        if not client:
-            return None
-            
-        db = client.chatbot_builder
-        print(f"🔍 Searching for bot_id: {bot_id}")
-        
-        # Get the specific bot
-        bot_config = db.chatbots.find_one({'bot_id': bot_id})
-        print(f"✅ Bot found: {bot_config is not None}")
-        
-        client.close()
-        return bot_config
-        
+        return _load_bot_config(bot_id)
+    except BotNotFound:
+        return None
+    except (ConnectionFailure, ConfigurationError):
+        raise
     except Exception as e:
-        print(f"❌ Error getting bot config: {e}")
+        logger.error("❌ Error getting bot config: %s", e)
         return None
 
+def clear_bot_config_cache(bot_id):
+    """Force the next get_bot_config call for this bot to refetch from MongoDB"""
+    _load_bot_config.clear(bot_id)  # only this bot's entry, not every bot's
+
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 2  # seconds
+LOG_QUEUE_SIZE = 10000
+
+def _flush_chat_logs(log_queue):
+    """Background loop: drain buffered chat logs into MongoDB in batches"""
+    while True:
+        batch = [log_queue.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(batch) < LOG_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(log_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        
+        try:
+            _mongo().chatbot_builder.chat_sessions.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error("Error logging chat: %s", e)
+
+@st.cache_resource(show_spinner=False)
+def _chat_log_queue():
+    """Bounded chat log buffer and its flush thread - one per process"""
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    threading.Thread(target=_flush_chat_logs, args=(log_queue,), daemon=True).start()
+    return log_queue
+
 def log_chat_session(bot_id, user_message, bot_response):
-    """Log chat session to database"""
+    """Queue chat session for logging - never blocks the chat response"""
     try:
-        client = get_mongodb_client()
-        if client:
-            db = client.chatbot_builder
-            db.chat_sessions.insert_one({
-                'bot_id': bot_id,
-                'user_message': user_message,
-                'bot_response': bot_response,
-                'timestamp': datetime.utcnow(),
-                'source': 'public_chat'
-            })
-            client.close()
-    except Exception as e:
-        print(f"Error logging chat: {e}")
+        _chat_log_queue().put_nowait({
+            'bot_id': bot_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'timestamp': datetime.utcnow(),
+            'source': 'public_chat'
+        })
+    except queue.Full:
+        logger.warning("⚠️ Chat log buffer full, dropping entry")
+
+BOT_SESSION_TTL = 300  # seconds a session trusts its loaded bot config
+
+def reload_bot_config(bot_id):
+    """Drop this bot's session and process caches so the next run refetches it"""
+    st.session_state.pop('loaded_bot', None)
+    clear_bot_config_cache(bot_id)
+    clear_answer_cache(bot_id)
+
+PAGE_CONFIG = {
+    'page_title': "ChatBot",
+    'page_icon': "🤖",
+    'layout': "centered"
+}
 
 def main():
-    st.set_page_config(
-        page_title="ChatBot",
-        page_icon="🤖", 
-        layout="centered"
-    )
+    st.set_page_config(**PAGE_CONFIG)
     
     # ✅ FIXED: Proper query parameter extraction
     query_params = st.query_params
@@ -82,8 +159,6 @@ def main():
     if isinstance(bot_id, list):
         bot_id = bot_id[0] if bot_id else ""
     
-    st.info(f"🔄 Loading chatbot with ID: `{bot_id}`")
-    
     if not bot_id:
         st.error("""
         ## No chatbot specified! 
@@ -93,25 +168,39 @@ def main():
         """)
         st.stop()
     
-    # Test MongoDB connection first
-    with st.spinner("Connecting to database..."):
-        client = get_mongodb_client()
-        if not client:
-            st.error("""
-            ## Database Connection Failed
-            
-            Cannot connect to MongoDB. Please check:
-            - MongoDB URI in environment variables
-            - Network connectivity
-            - Database permissions
-            """)
-            st.stop()
-        else:
-            client.close()
-    
-    # Get bot configuration
-    with st.spinner("Loading chatbot configuration..."):
-        bot_config = get_bot_config(bot_id)
+    # Reruns (every message, every widget interaction) reuse the loaded config;
+    # network calls only on first load, after the TTL, or on an explicit reload
+    loaded_bot = st.session_state.get('loaded_bot')
+    if (loaded_bot and loaded_bot['bot_id'] == bot_id
+            and time.monotonic() - loaded_bot['loaded_at'] < BOT_SESSION_TTL):
+        bot_config = loaded_bot['config']
+        just_loaded = False
+    else:
+        just_loaded = True
+        st.info(f"🔄 Loading chatbot with ID: `{bot_id}`")
+        
+        # Get bot configuration - the first real query surfaces connection errors
+        with st.spinner("Loading chatbot configuration..."):
+            try:
+                bot_config = get_bot_config(bot_id)
+            except (ConnectionFailure, ConfigurationError) as e:
+                logger.error("❌ MongoDB connection failed: %s", e)
+                st.error("""
+                ## Database Connection Failed
+                
+                Cannot connect to MongoDB. Please check:
+                - MongoDB URI in environment variables
+                - Network connectivity
+                - Database permissions
+                """)
+                st.stop()
+        
+        if bot_config:
+            st.session_state.loaded_bot = {
+                'bot_id': bot_id,
+                'config': bot_config,
+                'loaded_at': time.monotonic()
+            }
     
     if not bot_config:
         st.error(f"""
@@ -144,7 +233,9 @@ def main():
     if bot_config.get('description'):
         st.write(bot_config['description'])
     
-    st.success("✅ Chatbot loaded successfully!")
+    # Load status only when the config was actually (re)loaded this run
+    if just_loaded:
+        st.success("✅ Chatbot loaded successfully!")
     st.caption("Ask me anything about my knowledge base!")
     
     # Initialize chat history in session state
@@ -179,37 +270,38 @@ def main():
                     system_prompt=bot_config.get('system_prompt', ''),
                     temperature=bot_config.get('temperature', 0.7)
                 )
+            
+            if result['success']:
+                # Stream the response as it is generated
+                answer = st.write_stream(result['answer_stream'])
+                
+                # Show sources if available
+                if result.get('sources'):
+                    with st.expander("📚 Sources"):
+                        for source in result['sources']:
+                            st.write(f"**{source['document']}** - Page {source['page']}")
+                
+                # Add to chat history
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": answer
+                })
+                
+                # Log the chat session
+                log_chat_session(bot_id, prompt, answer)
                 
-                if result['success']:
-                    # Display the response
-                    st.markdown(result['answer'])
-                    
-                    # Show sources if available
-                    if result.get('sources'):
-                        with st.expander("📚 Sources"):
-                            for source in result['sources']:
-                                st.write(f"**{source['document']}** - Page {source['page']}")
-                    
-                    # Add to chat history
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": result['answer']
-                    })
-                    
-                    # Log the chat session
-                    log_chat_session(bot_id, prompt, result['answer'])
-                    
-                else:
-                    # Error handling
-                    error_msg = result.get('error', 'Sorry, I encountered an error processing your question.')
-                    st.error(error_msg)
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": error_msg
-                    })
+            else:
+                # Error handling
+                error_msg = result.get('error', 'Sorry, I encountered an error processing your question.')
+                st.error(error_msg)
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": error_msg
+                })
     
     # Footer
     st.markdown("---")
+    st.button("🔄 Reload chatbot", on_click=reload_bot_config, args=(bot_id,))
     st.caption("Powered by AI • ChatBot Builder")
 
 if __name__ == "__main__":
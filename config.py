@@ -1,7 +1,10 @@
 import os
+import logging
 import streamlit as st
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 def get_api_key(api_key_name):
     """
     Get API key from environment variables or Streamlit secrets
@@ -39,10 +42,16 @@ def get_qdrant_config():
     """
     api_key = get_api_key('QDRANT_API_KEY')
     url = get_api_key('QDRANT_URL')
-    print(f"Qdrant Config - URL: {url}, API Key: {api_key[:20]}...")  # Debug
+    logger.debug("Qdrant config loaded - URL: %s, API key set: %s", url, bool(api_key))
     return {
         'api_key': api_key,
-        'url': url
+        'url': url,
+        # 'scalar' (int8, ~4x smaller) or 'binary' (1 bit/dim, ~32x smaller, lower recall)
+        'quantization': get_api_key('QDRANT_QUANTIZATION') or 'scalar',
+        # HNSW: ef = search beam width (latency vs recall), m / ef_construct = graph quality at build time
+        'hnsw_ef': int(get_api_key('QDRANT_HNSW_EF') or 64),
+        'hnsw_m': int(get_api_key('QDRANT_HNSW_M') or 16),
+        'hnsw_ef_construct': int(get_api_key('QDRANT_HNSW_EF_CONSTRUCT') or 128)
     }
 
 def get_mongodb_uri():
@@ -51,7 +60,7 @@ def get_mongodb_uri():
     """
     uri = get_api_key('MONGODB_URI')
     if not uri:
-        print("❌ MONGODB_URI not found in environment variables")
+        logger.error("❌ MONGODB_URI not found in environment variables")
     else:
-        print(f"✅ MongoDB URI found: {uri[:50]}...")
+        logger.debug("✅ MongoDB URI found")
     return uri
\ No newline at end of file
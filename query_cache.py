@@ -0,0 +1,117 @@
+import time
+import logging
+import unicodedata
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query):
+    """
+    Canonical form of a query used as the exact-match cache key:
+    NFKC, lowercase, collapsed whitespace, no trailing punctuation
+    ("Hello", " hello! " and "hello?" share one key).
+    """
+    query = unicodedata.normalize("NFKC", query)
+    return " ".join(query.lower().split()).rstrip("?.!,;: ")
+
+class SmartRAGCache:
+    """
+    Two-tier answer cache in front of the RAG pipeline:
+    exact match on (bot_id, variant, normalized query), then cosine similarity
+    against the embeddings of recently answered queries for the same bot and
+    variant. The variant is any hashable describing how answers are produced
+    (e.g. system prompt hash + temperature), so changing it misses.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, similarity_threshold=0.95, embed_fn=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self._entries = OrderedDict()  # (bot_id, variant, normalized query) -> (expires_at, embedding, value)
+        self._lock = threading.RLock()
+
+    def _embed(self, query):
+        """Unit-length float32 embedding of the query, or None if unavailable"""
+        if self.embed_fn is None:
+            return None
+        try:
+            vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        except Exception as e:
+            logger.error("❌ Cache embedding failed: %s", e)
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _get_exact(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def _get_semantic(self, bot_id, variant, embedding):
+        now = time.monotonic()
+        keys, vectors = [], []
+        for key, (expires_at, vector, _) in self._entries.items():
+            if key[:2] == (bot_id, variant) and vector is not None and expires_at >= now:
+                keys.append(key)
+                vectors.append(vector)
+        if not vectors:
+            return None
+
+        similarities = np.stack(vectors) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        self._entries.move_to_end(keys[best])
+        return self._entries[keys[best]][2]
+
+    def get(self, bot_id, query, embedding=None, variant=None):
+        """Return the cached value for a query, or None on a miss"""
+        key = (bot_id, variant, normalize_query(query))
+        with self._lock:
+            value = self._get_exact(key)
+            if value is not None or embedding is None:
+                return value
+            return self._get_semantic(bot_id, variant, embedding)
+
+    def put(self, bot_id, query, value, embedding=None, variant=None):
+        """Store a value, evicting the least recently used entries past max_entries"""
+        key = (bot_id, variant, normalize_query(query))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, embedding, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, bot_id, query, variant=None):
+        """
+        Return (value, embedding). The embedding is computed only when the
+        exact tier misses, and can be passed to put() to avoid re-embedding.
+        """
+        value = self.get(bot_id, query, variant=variant)
+        if value is not None:
+            logger.debug("✅ Query cache hit (exact)")
+            return value, None
+
+        embedding = self._embed(query)
+        if embedding is not None:
+            value = self.get(bot_id, query, embedding, variant)
+            if value is not None:
+                logger.debug("✅ Query cache hit (semantic)")
+        return value, embedding
+
+    def clear(self, bot_id=None):
+        """Drop all entries, or only those belonging to one bot"""
+        with self._lock:
+            if bot_id is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == bot_id]:
+                del self._entries[key]
@@ -1,160 +1,399 @@
 import os
+import time
+import asyncio
+import hashlib
+import functools
+import itertools
+import logging
+import httpx
+import tiktoken
 import streamlit as st
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
+from langchain_core.messages import SystemMessage
 from langchain_groq import ChatGroq
-from langchain.chains import RetrievalQA
-from vector_store import get_vector_store
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
+from langchain_core.outputs import Generation
+from langchain_core.globals import set_llm_cache, get_llm_cache
+from langchain_community.cache import SQLiteCache
+from vector_store import (
+    get_qdrant_client, get_bot_collection_name, get_embedding_model,
+    is_hybrid_collection_cached, search_by_vector_with_score
+)
 from config import validate_api_key
+from query_cache import SmartRAGCache
+
+logger = logging.getLogger(__name__)
+
+# Persistent LLM response cache: keyed on the fully rendered prompt (system
+# prompt + retrieved context + question), so knowledge base changes that alter
+# the retrieved context naturally miss
+LLM_CACHE_PATH = ".langchain_groq.db"
+set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+
+GROQ_KEEPALIVE_EXPIRY = 30  # seconds an idle pooled Groq connection is kept open
+_groq_last_used = float('-inf')  # monotonic time the shared client last talked to Groq
+
+def mark_groq_used():
+    """Record that the pooled Groq connection was just used"""
+    global _groq_last_used
+    _groq_last_used = time.monotonic()
 
 @st.cache_resource(show_spinner=False)
-def get_cached_qa_chain(groq_api_key, user_id, bot_id, system_prompt, temperature):
-    """Cached QA chain - only loads once per user session"""
+def get_http_client():
+    """Shared keep-alive HTTP/2 client so Groq calls reuse pooled, multiplexed TLS connections"""
+    return httpx.Client(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=64,
+            max_keepalive_connections=32,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY
+        ),
+        timeout=30
+    )
+
+GROQ_BASE_URL = "https://api.groq.com"
+GROQ_MODEL = "llama-3.1-8b-instant"
+KNOWLEDGE_BASE_NOT_READY = "Knowledge base not ready. Please add documents first."
+URL_PREFIXES = ('http://', 'https://')
+EXCERPT_LENGTH = 200
+RETRIEVAL_K = 5  # Get top 5 relevant documents
+CONTEXT_TOKEN_BUDGET = 1024  # Max prompt tokens spent on retrieved context
+DEFAULT_TEMPERATURE = 0.7
+
+@st.cache_resource(show_spinner=False)
+def get_tokenizer():
+    """Cached tokenizer used to budget context (close to Llama 3's BPE)"""
+    return tiktoken.get_encoding("cl100k_base")
+
+def _prewarm_groq():
+    """
+    Open a pooled connection to Groq before the LLM call needs it - only when
+    the client has been idle long enough for its keep-alive connection to expire
+    """
+    if time.monotonic() - _groq_last_used < GROQ_KEEPALIVE_EXPIRY:
+        return
+    
     try:
-        print(f"🔍 Creating QA chain for user: {user_id}, bot: {bot_id}")
-        db = get_vector_store(user_id, bot_id)
-        
-        if db is None:
-            print("❌ Vector store is None - knowledge base not found")
-            return None
+        get_http_client().head(GROQ_BASE_URL, timeout=5)
+        mark_groq_used()
+    except Exception as e:
+        logger.warning("⚠️ Groq prewarm failed: %s", e)
 
-        print("✅ Vector store loaded successfully")
-        
-        # Simple, effective prompt
-        CUSTOM_PROMPT_TEMPLATE = f"""
-        {system_prompt}
+def _retrieve(user_id, bot_id, query, embedding, hybrid):
+    """Top-k documents with their similarity scores, reusing the query's embedding if given"""
+    if embedding is None:
+        embedding = embed_query(query)
+    return search_by_vector_with_score(user_id, bot_id, query, embedding, k=RETRIEVAL_K, hybrid=hybrid)
 
-        Use the pieces of information provided in the context to answer user's question.
-        If you dont know the answer, just say that you dont know, dont try to make up an answer. 
-        Dont provide anything out of the given context
+async def _retrieve_with_prewarm(user_id, bot_id, query, embedding, hybrid):
+    """Run Qdrant retrieval and the Groq connection prewarm concurrently"""
+    scored_documents, _ = await asyncio.gather(
+        asyncio.to_thread(_retrieve, user_id, bot_id, query, embedding, hybrid),
+        asyncio.to_thread(_prewarm_groq)
+    )
+    return scored_documents
 
-        Context: {{context}}
-        Question: {{question}}
+def embed_query(query):
+    """Embed a single query with the cached embedding model"""
+    embedding_model = get_embedding_model()
+    if embedding_model is None:
+        raise ValueError("Embedding model not available")
+    return embedding_model.embed_query(query)
 
-        Start the answer directly. No small talk please.
-        """
-        
-        prompt = PromptTemplate(
-            template=CUSTOM_PROMPT_TEMPLATE, 
-            input_variables=["context", "question"]
-        )
+ANSWER_INSTRUCTIONS = """Use the pieces of information provided in the context to answer user's question.
+If you dont know the answer, just say that you dont know, dont try to make up an answer.
+Dont provide anything out of the given context.
+Start the answer directly. No small talk please."""
 
-        # Simple retriever
-        retriever = db.as_retriever(
-            search_kwargs={"k": 5}  # Get top 5 relevant documents
-        )
-        
-        # LLM config
-        llm = ChatGroq(
-            model_name="llama-3.1-8b-instant",
-            temperature=temperature,
-            groq_api_key=groq_api_key,
-        )
+# Parsed once at import; only the system message differs between bots
+HUMAN_PROMPT = HumanMessagePromptTemplate.from_template("Context: {context}\n\nQuestion: {question}")
+
+@functools.lru_cache(maxsize=256)
+def build_prompt(system_prompt):
+    """
+    Chat prompt for a bot, built once per system prompt and shared by all
+    bots using the same one. The system message is static every turn so the
+    provider's prefix cache can reuse it; retrieved context goes in the user
+    turn. It is kept literal, so braces in system_prompt are safe.
+    """
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=f"{system_prompt}\n\n{ANSWER_INSTRUCTIONS}"),
+        HUMAN_PROMPT
+    ])
+
+# Answers shared across sessions: exact + semantic (cosine > 0.95) matches
+query_cache = SmartRAGCache(similarity_threshold=0.95, embed_fn=embed_query)
+
+def answer_settings(system_prompt, temperature):
+    """
+    Stripped system prompt, its hash and the rounded temperature - shared by the
+    chain and answer caches. A missing or non-numeric temperature uses the default.
+    """
+    system_prompt = (system_prompt or '').strip()
+    system_prompt_hash = hashlib.blake2b(system_prompt.encode(), digest_size=16).hexdigest()
+    try:
+        temperature = round(float(temperature), 2)
+    except (TypeError, ValueError):
+        logger.warning("⚠️ Invalid temperature %r, using %s", temperature, DEFAULT_TEMPERATURE)
+        temperature = DEFAULT_TEMPERATURE
+    return system_prompt, system_prompt_hash, temperature
+
+def clear_answer_cache(bot_id):
+    """Drop cached answers for one bot, e.g. after its prompt or knowledge base changed"""
+    query_cache.clear(bot_id)
+
+def get_cached_collection_mode(user_id, bot_id):
+    """
+    Whether the bot's collection is hybrid, from vector_store's layout memo
+    (shared with ingestion, expires after COLLECTION_CACHE_TTL). Survives
+    prompt edits. A missing collection raises, so the miss is never cached.
+    """
+    return is_hybrid_collection_cached(get_qdrant_client(), get_bot_collection_name(user_id, bot_id))
+
+@st.cache_resource(show_spinner=False)
+def get_cached_answer_chain(groq_api_key, system_prompt_hash, temperature, _system_prompt):
+    """
+    Cached prompt + LLM (the cheap part). Keyed by a hash of the stripped
+    system prompt; _system_prompt is excluded from Streamlit's cache key.
+    """
+    prompt = build_prompt(_system_prompt)
+    
+    # LLM config
+    llm = ChatGroq(
+        model_name=GROQ_MODEL,
+        temperature=temperature,
+        groq_api_key=groq_api_key,
+        http_client=get_http_client(),
+    )
+    
+    logger.debug("✅ Answer chain created successfully")
+    return {
+        'prompt': prompt,
+        'answer_chain': prompt | llm | StrOutputParser(),
+        'llm_string': f"groq:{GROQ_MODEL}:temperature={temperature}"
+    }
+
+def get_cached_qa_chain(groq_api_key, user_id, bot_id, system_prompt, temperature):
+    """
+    QA chain composed from two caches, so whitespace edits to the system prompt
+    or temperature tweaks only rebuild the cheap LLM wrapper, not the collection lookup.
+    """
+    try:
+        hybrid = get_cached_collection_mode(user_id, bot_id)
         
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True,
-            chain_type_kwargs={'prompt': prompt}
+        system_prompt, system_prompt_hash, temperature = answer_settings(system_prompt, temperature)
+        answer_chain = get_cached_answer_chain(
+            groq_api_key, system_prompt_hash, temperature, system_prompt
         )
         
-        print("✅ QA chain created successfully")
-        return qa_chain
+        return {'hybrid': hybrid, **answer_chain}
         
     except Exception as e:
-        print(f"❌ Error creating QA chain: {e}")
+        logger.error("❌ Error creating QA chain: %s", e)
         return None
 
+def format_source(doc):
+    """Format one source document for display."""
+    metadata = doc.metadata
+    source = metadata.get('source', 'Unknown')
+    
+    # Determine source type and name
+    if isinstance(source, str) and source.startswith(URL_PREFIXES):
+        source_type = 'web'
+        source_name = source
+    else:
+        source_type = 'pdf'
+        source_name = os.path.basename(str(source)) if source else 'Unknown'
+    
+    # Get page number
+    page_num = metadata.get('page', 'N/A')
+    if isinstance(page_num, int):
+        page_num += 1  # Make it 1-indexed for display
+    
+    # Excerpt: the chunk itself if short, else its start with an ellipsis
+    content = doc.page_content
+    excerpt = content if len(content) <= EXCERPT_LENGTH else content[:EXCERPT_LENGTH] + '...'
+    
+    return {
+        'document': source_name,
+        'page': page_num,
+        'excerpt': excerpt,
+        'type': source_type
+    }
+
 def format_source_documents(source_documents):
     """Format source documents for display."""
-    formatted_sources = []
+    try:
+        return [format_source(doc) for doc in source_documents]
+    except Exception as e:
+        # Rare malformed document: redo the slow way, skipping only the bad ones
+        logger.error("Error formatting source: %s", e)
     
+    formatted_sources = []
     for doc in source_documents:
         try:
-            metadata = doc.metadata
-            source = metadata.get('source', 'Unknown')
-            
-            # Determine source type and name
-            if isinstance(source, str) and source.startswith(('http://', 'https://')):
-                source_type = 'web'
-                source_name = source
-            else:
-                source_type = 'pdf'
-                source_name = os.path.basename(str(source)) if source else 'Unknown'
-            
-            # Get page number
-            page_num = metadata.get('page', 'N/A')
-            if isinstance(page_num, int):
-                page_num += 1  # Make it 1-indexed for display
-            
-            # Create excerpt
-            excerpt = doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-            
-            formatted_sources.append({
-                'document': source_name,
-                'page': page_num,
-                'excerpt': excerpt,
-                'type': source_type
-            })
-            
-        except Exception as e:
-            print(f"Error formatting source: {e}")
+            formatted_sources.append(format_source(doc))
+        except Exception:
             continue
-    
     return formatted_sources
 
+def stream_answer(qa_chain, inputs):
+    """Stream the answer from Groq, served from / saved to the LLM response cache."""
+    llm_cache = get_llm_cache()
+    prompt_key = qa_chain['prompt'].format(**inputs)
+    
+    cached_generations = llm_cache.lookup(prompt_key, qa_chain['llm_string'])
+    if cached_generations:
+        logger.debug("✅ LLM cache hit")
+        yield cached_generations[0].text
+        return
+    
+    chunks = []
+    try:
+        for chunk in qa_chain['answer_chain'].stream(inputs):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        mark_groq_used()
+    llm_cache.update(prompt_key, qa_chain['llm_string'], [Generation(text="".join(chunks))])
+
+def pack_context(scored_documents, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Keep the highest-scoring documents until the token budget is spent.
+    The document that crosses the budget is cut at a token boundary.
+    """
+    tokenizer = get_tokenizer()
+    packed = []
+    remaining = token_budget
+    
+    for doc, _ in sorted(scored_documents, key=lambda item: -item[1]):
+        tokens = tokenizer.encode(doc.page_content)
+        if len(tokens) <= remaining:
+            packed.append(doc)
+            remaining -= len(tokens)
+            continue
+        if remaining > 0:
+            packed.append(Document(
+                page_content=tokenizer.decode(tokens[:remaining]),
+                metadata=doc.metadata
+            ))
+        break
+    
+    return packed
+
+def format_context(source_documents):
+    """Stuff retrieved documents into a single context string."""
+    return "\n\n".join(doc.page_content for doc in source_documents)
+
+def get_error_message(error):
+    """Map an exception to a user-facing error message."""
+    error_msg = "Sorry, I encountered an issue processing your question. Please try again."
+    
+    if "timeout" in str(error).lower():
+        error_msg = "Request timed out. Please try a shorter question."
+    elif "rate limit" in str(error).lower():
+        error_msg = "Rate limit exceeded. Please wait a moment and try again."
+    elif "api key" in str(error).lower():
+        error_msg = "API configuration issue. Please check your settings."
+    elif "doesn't exist" in str(error).lower():  # Qdrant: collection not created yet
+        error_msg = KNOWLEDGE_BASE_NOT_READY
+    
+    return error_msg
+
+def _stream_and_cache(answer_stream, bot_id, query, sources, embedding, variant):
+    """Yield answer chunks, caching the full answer once the stream completes."""
+    chunks = []
+    try:
+        for chunk in answer_stream:
+            chunks.append(chunk)
+            yield chunk
+    except Exception as e:
+        logger.error("❌ Answer streaming error: %s", e)
+        yield ("\n\n" if chunks else "") + get_error_message(e)
+        return
+    
+    answer = "".join(chunks)
+    logger.debug("✅ Answer length: %s characters", len(answer))
+    query_cache.put(bot_id, query, {'answer': answer, 'sources': sources}, embedding, variant)
+
 def process_bot_query(user_id, bot_id, query, system_prompt, temperature):
-    """Process user query and return answer with sources."""
+    """
+    Process user query and return a streamed answer with sources.
+    Served from the answer cache when possible; 'answer_stream' yields text chunks.
+    """
+    return asyncio.run(aprocess_bot_query(user_id, bot_id, query, system_prompt, temperature))
+
+async def aprocess_bot_query(user_id, bot_id, query, system_prompt, temperature):
+    """Async version of process_bot_query."""
+    # Answers depend on the prompt and temperature too, so edits to either miss
+    _, system_prompt_hash, rounded_temperature = answer_settings(system_prompt, temperature)
+    variant = (system_prompt_hash, rounded_temperature)
+    cached, embedding = await asyncio.to_thread(query_cache.lookup, bot_id, query, variant)
+    if cached is not None:
+        return {
+            'success': True,
+            'answer_stream': iter([cached['answer']]),
+            'sources': cached['sources']
+        }
+    
+    result = await _arun_bot_query(user_id, bot_id, query, system_prompt, temperature, embedding)
+    if result['success']:
+        result['answer_stream'] = _stream_and_cache(
+            result['answer_stream'], bot_id, query, result['sources'], embedding, variant
+        )
+    return result
+
+async def _arun_bot_query(user_id, bot_id, query, system_prompt, temperature, embedding=None):
+    """
+    Run the full RAG pipeline (retrieval + generation) for a query.
+    embedding, if given, is the query vector already computed for the answer cache.
+    """
     try:
-        print(f"🔍 Processing query for user: {user_id}, bot: {bot_id}")
-        print(f"🔍 Query: {query}")
+        logger.debug("🔍 Processing query for user: %s, bot: %s", user_id, bot_id)
+        logger.debug("🔍 Query: %s", query)
         
         groq_api_key = validate_api_key()
-        print("✅ Groq API key validated")
+        logger.debug("✅ Groq API key validated")
         
         # Get cached chain
         qa_chain = get_cached_qa_chain(groq_api_key, user_id, bot_id, system_prompt, temperature)
         
         if not qa_chain:
-            print("❌ QA chain is None - returning knowledge base error")
+            logger.error("❌ QA chain is None - returning knowledge base error")
             return {
                 'success': False,
-                'error': "Knowledge base not ready. Please add documents first."
+                'error': KNOWLEDGE_BASE_NOT_READY
             }
         
-        print("✅ QA chain loaded - processing query...")
+        logger.debug("✅ QA chain loaded - processing query...")
         
-        # Process query
-        response = qa_chain.invoke({'query': query})
-        answer = response.get("result", "No answer generated.")
-        source_documents = response.get("source_documents", [])
+        # Retrieve straight from Qdrant with the cache lookup's embedding, while the Groq connection warms up
+        scored_documents = await _retrieve_with_prewarm(user_id, bot_id, query, embedding, qa_chain['hybrid'])
+        source_documents = pack_context(scored_documents)
+        logger.debug("✅ Sources found: %s, packed into context: %s", len(scored_documents), len(source_documents))
         
-        print(f"✅ Query processed successfully")
-        print(f"✅ Answer length: {len(answer)} characters")
-        print(f"✅ Sources found: {len(source_documents)}")
+        answer_stream = stream_answer(qa_chain, {
+            'context': format_context(source_documents),
+            'question': query
+        })
         
-        # Format sources
-        formatted_sources = format_source_documents(source_documents)
+        # Wait for Groq's first token while the sources are formatted;
+        # the rest of the answer streams as the caller consumes it
+        first_chunk, formatted_sources = await asyncio.gather(
+            asyncio.to_thread(next, answer_stream, ""),
+            asyncio.to_thread(format_source_documents, source_documents)
+        )
         
         return {
             'success': True,
-            'answer': answer,
+            'answer_stream': itertools.chain([first_chunk], answer_stream),
             'sources': formatted_sources
         }
             
     except Exception as e:
-        # Error handling
-        error_msg = "Sorry, I encountered an issue processing your question. Please try again."
-        
-        if "timeout" in str(e).lower():
-            error_msg = "Request timed out. Please try a shorter question."
-        elif "rate limit" in str(e).lower():
-            error_msg = "Rate limit exceeded. Please wait a moment and try again."
-        elif "api key" in str(e).lower():
-            error_msg = "API configuration issue. Please check your settings."
-            
-        print(f"❌ Query processing error: {e}")
+        logger.error("❌ Query processing error: %s", e)
         return {
             'success': False,
-            'error': error_msg
+            'error': get_error_message(e)
         }
\ No newline at end of file
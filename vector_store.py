@@ -1,66 +1,401 @@
+import os
+import time
+import functools
+import uuid
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
 import streamlit as st
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, Filter, FieldCondition, MatchValue
-from config import get_qdrant_config
+from qdrant_client.models import (
+    Distance, VectorParams, Filter, FieldCondition, MatchValue, MatchAny,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, HnswConfigDiff,
+    SearchParams, QuantizationSearchParams, QueryRequest, PointStruct,
+    SparseVectorParams, SparseVector, Modifier, Prefetch, FusionQuery, Fusion,
+    PayloadSchemaType
+)
+from config import get_qdrant_config, get_api_key
+
+logger = logging.getLogger(__name__)
+
+# Optional integrations, resolved once at import instead of on every model/vector store build
+try:
+    from langchain_huggingface import HuggingFaceEmbeddings
+except ImportError:
+    try:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+    except ImportError:
+        HuggingFaceEmbeddings = None
+
+try:
+    from langchain_qdrant import Qdrant, QdrantVectorStore, FastEmbedSparse, RetrievalMode
+except ImportError:
+    from langchain_community.vectorstores import Qdrant
+    QdrantVectorStore = FastEmbedSparse = RetrievalMode = None
+    logger.warning(
+        "⚠️ langchain_qdrant>=0.1.2 not available - get_vector_store falls back to the "
+        "legacy Qdrant wrapper (dense-only, needs client.search, gone in qdrant-client 1.16)"
+    )
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_ONNX_MODEL_DIR = "model_onnx"
+EMBEDDING_DIMENSION = 384
+SPARSE_MODEL_NAME = "Qdrant/bm25"
+
+# Named vectors of hybrid collections; older collections hold one unnamed dense vector
+DENSE_VECTOR_NAME = "dense"
+SPARSE_VECTOR_NAME = "sparse"
+
+
+QDRANT_POOL_SIZE = 32
+UPSERT_BATCH_SIZE = 256
+
+# Payload keys the remove_documents_by_* filters match on
+PAYLOAD_INDEX_FIELDS = ('metadata.source', 'metadata.source_type', 'metadata.source_id')
+
+@functools.lru_cache(maxsize=1)
+def get_search_params():
+    """ANN search settings: bounded HNSW beam, quantized candidates rescored with full vectors"""
+    qdrant_config = get_qdrant_config()
+    return SearchParams(
+        hnsw_ef=qdrant_config['hnsw_ef'],
+        exact=False,
+        quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+    )
 
 def get_bot_collection_name(user_id, bot_id):
     """Get bot-specific Qdrant collection name"""
     collection_name = f"chatbot_{user_id}_{bot_id}"
-    print(f"🔍 Qdrant collection name: {collection_name}")
+    logger.debug("🔍 Qdrant collection name: %s", collection_name)
     return collection_name
 
 @st.cache_resource
 def get_qdrant_client():
-    """Cached Qdrant client"""
+    """Cached Qdrant client (gRPC transport)"""
     qdrant_config = get_qdrant_config()
-    print(f"🔍 Qdrant config: URL={qdrant_config['url']}, API Key length={len(qdrant_config['api_key'])}")
+    logger.debug("🔍 Qdrant config: URL=%s", qdrant_config['url'])
     return QdrantClient(
         url=qdrant_config['url'],
         api_key=qdrant_config['api_key'],
+        prefer_grpc=True,  # protobuf over a persistent HTTP/2 channel
+        grpc_port=6334,
+        pool_size=QDRANT_POOL_SIZE,  # concurrent Streamlit sessions share these connections
         timeout=30
     )
 
-def check_sentence_transformers():
-    """Check if sentence-transformers is available"""
+# Collection existence memo: collection_name -> (expires_at, exists)
+COLLECTION_CACHE_TTL = 60
+_collection_exists_cache = {}
+# Collection layout memo: collection_name -> (expires_at, hybrid)
+_collection_mode_cache = {}
+
+def collection_exists_cached(client, collection_name):
+    """Check if a collection exists, memoized for COLLECTION_CACHE_TTL seconds"""
+    cached = _collection_exists_cache.get(collection_name)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    exists = client.collection_exists(collection_name=collection_name)
+    _collection_exists_cache[collection_name] = (time.monotonic() + COLLECTION_CACHE_TTL, exists)
+    return exists
+
+def invalidate_collection_cache(collection_name):
+    """Forget the memoized existence and layout of a collection after it changes"""
+    _collection_exists_cache.pop(collection_name, None)
+    _collection_mode_cache.pop(collection_name, None)
+
+def is_hybrid_collection(client, collection_name):
+    """True if the collection has named dense + sparse vectors (raises if it doesn't exist)"""
+    params = client.get_collection(collection_name=collection_name).config.params
+    return isinstance(params.vectors, dict) and SPARSE_VECTOR_NAME in (params.sparse_vectors or {})
+
+def is_hybrid_collection_cached(client, collection_name):
+    """
+    is_hybrid_collection, memoized for COLLECTION_CACHE_TTL seconds.
+    A missing collection raises and is not memoized.
+    """
+    cached = _collection_mode_cache.get(collection_name)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    hybrid = is_hybrid_collection(client, collection_name)
+    expires_at = time.monotonic() + COLLECTION_CACHE_TTL
+    _collection_mode_cache[collection_name] = (expires_at, hybrid)
+    _collection_exists_cache[collection_name] = (expires_at, True)
+    return hybrid
+
+class ONNXEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 embeddings from an int8-quantized ONNX export (onnxruntime, CPU).
+    Produces the same mean-pooled, L2-normalized vectors as HuggingFaceEmbeddings.
+
+    Export once into model_dir:
+        optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 --task feature-extraction model_onnx/
+        python -c "from onnxruntime.quantization import quantize_dynamic, QuantType; \
+            quantize_dynamic('model_onnx/model.onnx', 'model_onnx/model_int8.onnx', weight_type=QuantType.QUInt8)"
+    """
+
+    def __init__(self, model_dir, batch_size=64, max_length=256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model_int8.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            inputs['token_type_ids'] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+    def embed_documents(self, texts):
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._encode(texts[start:start + self.batch_size]))
+        return embeddings
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+def get_onnx_embedding_model():
+    """Load the quantized ONNX embedding model if it has been exported, else None"""
+    model_dir = get_api_key('EMBEDDING_ONNX_DIR') or DEFAULT_ONNX_MODEL_DIR
+    if not os.path.exists(os.path.join(model_dir, "model_int8.onnx")):
+        return None
+    
     try:
-        import sentence_transformers
-        from sentence_transformers import SentenceTransformer
-        print("✅ sentence-transformers is properly installed")
-        return True
-    except ImportError as e:
-        print(f"❌ sentence-transformers import error: {e}")
-        return False
+        embedding_model = ONNXEmbeddings(model_dir)
+        logger.debug("✅ Using int8 ONNX embeddings from %s", model_dir)
+        return embedding_model
+    except Exception as e:
+        logger.error("❌ Could not load ONNX embeddings, falling back: %s", e)
+        return None
 
-def get_embedding_model():
-    """Get embedding model with fallback options"""
+class FastEmbedTextEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 through FastEmbed's ONNX export (fp32, downloaded on first use).
+    No export step and no torch runtime. fastembed>=0.3.1 mean-pools like
+    sentence-transformers, so vectors match HuggingFaceEmbeddings(normalize_embeddings=True).
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=64):
+        from fastembed import TextEmbedding
+
+        self.model = TextEmbedding(model_name, threads=os.cpu_count())
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        return [vector.tolist() for vector in self.model.embed(texts, batch_size=self.batch_size)]
+
+    def embed_query(self, text):
+        return next(iter(self.model.query_embed(text))).tolist()
+
+def get_fastembed_embedding_model():
+    """Load the FastEmbed ONNX embedding model, or None if fastembed is unavailable"""
     try:
-        # Try new import first
-        from langchain_huggingface import HuggingFaceEmbeddings
-        print("✅ Using langchain_huggingface embeddings")
-    except ImportError:
-        try:
-            # Fallback to community import
-            from langchain_community.embeddings import HuggingFaceEmbeddings
-            print("✅ Using langchain_community embeddings")
-        except ImportError as e:
-            print(f"❌ Could not import HuggingFaceEmbeddings: {e}")
-            return None
+        embedding_model = FastEmbedTextEmbeddings()
+        logger.debug("✅ Using FastEmbed ONNX embeddings")
+        return embedding_model
+    except Exception as e:
+        logger.error("❌ Could not load FastEmbed embeddings, falling back to PyTorch: %s", e)
+        return None
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so embed_query calls arriving concurrently from
+    several chat sessions are coalesced into one embed_documents forward pass.
+    A batch is flushed as soon as the queue is drained or max_batch_size is hit,
+    so a lone query never waits on a timer.
+    Query vectors are kept in a small LRU so the answer cache lookup and the
+    retriever share a single forward pass for the same query.
+    """
+
+    def __init__(self, model, max_batch_size=64, query_cache_size=1024):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.query_cache_size = query_cache_size
+        self._query_vectors = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._pending = queue.Queue()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                vectors = self.model.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._query_lock:
+            vector = self._query_vectors.get(text)
+            if vector is not None:
+                self._query_vectors.move_to_end(text)
+                return vector
+        
+        future = Future()
+        self._pending.put((text, future))
+        vector = future.result()
+        
+        with self._query_lock:
+            self._query_vectors[text] = vector
+            while len(self._query_vectors) > self.query_cache_size:
+                self._query_vectors.popitem(last=False)
+        return vector
+
+# Process-wide embedding model, shared by Streamlit sessions and background threads
+_EMBEDDING_MODEL = None
+_EMBEDDING_MODEL_LOCK = threading.Lock()
+
+def get_embedding_model():
+    """Get embedding model - loads once per process; a failed load is retried on the next call"""
+    global _EMBEDDING_MODEL
+    if _EMBEDDING_MODEL is None:
+        with _EMBEDDING_MODEL_LOCK:
+            if _EMBEDDING_MODEL is None:
+                embedding_model = load_embedding_model()
+                if embedding_model is None:
+                    return None
+                _EMBEDDING_MODEL = BatchedEmbeddings(embedding_model)
+    return _EMBEDDING_MODEL
+
+def embed_batch(texts):
+    """Embed a list of strings in a single batched call"""
+    embedding_model = get_embedding_model()
+    if embedding_model is None:
+        raise ValueError("Embedding model not available")
+    return embedding_model.embed_documents(list(texts))
+
+def load_embedding_model():
+    """Load embedding model with fallback options"""
+    # Prefer ONNX runtimes: faster CPU encode, a fraction of the RAM.
+    # A locally exported int8 model wins if present, then FastEmbed's build
+    for load_onnx_model in (get_onnx_embedding_model, get_fastembed_embedding_model):
+        embedding_model = load_onnx_model()
+        if embedding_model is not None:
+            return embedding_model
+    
+    if HuggingFaceEmbeddings is None:
+        logger.error("❌ Could not import HuggingFaceEmbeddings")
+        return None
     
     try:
-        # Verify sentence-transformers is working
-        if not check_sentence_transformers():
-            return None
-            
+        # Raises ImportError itself if sentence-transformers is missing
         embedding_model = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
+            model_name=EMBEDDING_MODEL_NAME,
             model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': 64}
         )
-        print("✅ Embedding model initialized successfully")
+        logger.debug("✅ Embedding model initialized successfully")
         return embedding_model
     except Exception as e:
-        print(f"❌ Error creating embedding model: {e}")
+        logger.error("❌ Error creating embedding model: %s", e)
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_sparse_embedding_model():
+    """BM25 sparse embeddings (FastEmbed) for hybrid collections, or None if unavailable"""
+    if FastEmbedSparse is None:
         return None
+    
+    try:
+        sparse_model = FastEmbedSparse(model_name=SPARSE_MODEL_NAME)
+        logger.debug("✅ Sparse embedding model initialized: %s", SPARSE_MODEL_NAME)
+        return sparse_model
+    except Exception as e:
+        logger.error("❌ Could not load sparse embeddings, hybrid search falls back to dense: %s", e)
+        return None
+
+def to_qdrant_sparse_vector(sparse_vector):
+    """Convert a LangChain sparse vector to Qdrant's model"""
+    return SparseVector(indices=sparse_vector.indices, values=sparse_vector.values)
+
+def embed_point_vectors(texts, hybrid=False):
+    """Vectors to upsert for texts: bare dense vectors, or named dense + sparse vectors for hybrid collections"""
+    dense_vectors = embed_batch(texts)
+    if not hybrid:
+        return dense_vectors
+    
+    sparse_model = get_sparse_embedding_model()
+    if sparse_model is None:
+        return [{DENSE_VECTOR_NAME: dense_vector} for dense_vector in dense_vectors]
+    
+    sparse_vectors = sparse_model.embed_documents(list(texts))
+    return [
+        {DENSE_VECTOR_NAME: dense_vector, SPARSE_VECTOR_NAME: to_qdrant_sparse_vector(sparse_vector)}
+        for dense_vector, sparse_vector in zip(dense_vectors, sparse_vectors)
+    ]
+
+def build_query_kwargs(dense_vector, k, hybrid=False, sparse_vector=None):
+    """
+    client.query_points arguments for one embedded query: plain dense search,
+    or for hybrid collections dense + sparse prefetches fused server-side with RRF
+    """
+    if not hybrid:
+        return {'query': dense_vector, 'limit': k, 'search_params': get_search_params(), 'with_payload': True}
+    
+    if sparse_vector is None:
+        return {
+            'query': dense_vector, 'using': DENSE_VECTOR_NAME, 'limit': k,
+            'search_params': get_search_params(), 'with_payload': True
+        }
+    
+    return {
+        'prefetch': [
+            Prefetch(query=dense_vector, using=DENSE_VECTOR_NAME, limit=k, params=get_search_params()),
+            Prefetch(query=to_qdrant_sparse_vector(sparse_vector), using=SPARSE_VECTOR_NAME, limit=k)
+        ],
+        'query': FusionQuery(fusion=Fusion.RRF),
+        'limit': k,
+        'with_payload': True
+    }
+
+def build_query_request(dense_vector, k, hybrid=False, sparse_vector=None):
+    """The same query as a QueryRequest for query_batch_points (search_params is named params there)"""
+    query_kwargs = build_query_kwargs(dense_vector, k, hybrid, sparse_vector)
+    return QueryRequest(params=query_kwargs.pop('search_params', None), **query_kwargs)
 
 def get_vector_store(user_id, bot_id):
     """Get Qdrant vector store for specific bot"""
@@ -70,57 +405,126 @@ def get_vector_store(user_id, bot_id):
     if not qdrant_config['api_key'] or not qdrant_config['url']:
         raise ValueError("Qdrant Cloud not configured")
     
+    client = get_qdrant_client()
+    
+    # Pick the retrieval mode from the memoized layout; a missing collection raises
+    hybrid = is_hybrid_collection_cached(client, collection_name)
+    
     try:
-        client = get_qdrant_client()
-        
-        # Check if collection exists
-        try:
-            collection_info = client.get_collection(collection_name=collection_name)
-            print(f"✅ Qdrant collection exists: {collection_name}")
-            print(f"📊 Collection points: {collection_info.points_count}")
-        except Exception as e:
-            print(f"❌ Qdrant collection not found: {collection_name}")
-            print(f"❌ Error: {e}")
-            return None
-        
         # Get embedding model
         embedding_model = get_embedding_model()
         if embedding_model is None:
-            print("❌ Failed to initialize embedding model")
+            logger.error("❌ Failed to initialize embedding model")
             return None
         
-        # Import Qdrant vector store
-        try:
-            from langchain_qdrant import Qdrant
-            print("✅ Using langchain_qdrant")
-        except ImportError:
-            from langchain_community.vectorstores import Qdrant
-            print("✅ Using langchain_community Qdrant")
-        
-        vector_store = Qdrant(
-            client=client,
-            collection_name=collection_name,
-            embeddings=embedding_model
-        )
+        if QdrantVectorStore is not None:
+            # Query API based: hybrid collections fuse dense + BM25 server-side,
+            # older unnamed-vector collections are searched dense-only
+            sparse_model = get_sparse_embedding_model() if hybrid else None
+            vector_store = QdrantVectorStore(
+                client=client,
+                collection_name=collection_name,
+                embedding=embedding_model,
+                sparse_embedding=sparse_model,
+                retrieval_mode=RetrievalMode.HYBRID if sparse_model else RetrievalMode.DENSE,
+                vector_name=DENSE_VECTOR_NAME if hybrid else "",
+                sparse_vector_name=SPARSE_VECTOR_NAME,
+                validate_collection_config=False
+            )
+        else:
+            vector_store = Qdrant(
+                client=client,
+                collection_name=collection_name,
+                embeddings=embedding_model,
+                vector_name=DENSE_VECTOR_NAME if hybrid else None
+            )
         
-        print(f"✅ Vector store created successfully for {collection_name}")
+        logger.debug("✅ Vector store created successfully for %s", collection_name)
         return vector_store
         
     except Exception as e:
-        print(f"❌ Error initializing Qdrant: {e}")
+        logger.error("❌ Error initializing Qdrant: %s", e)
         return None
 
+def get_quantization_config(mode):
+    """Quantized vector copy kept in RAM for search; originals are only read for rescoring"""
+    if mode == 'binary':
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+    )
+
+def create_bot_collection(user_id, bot_id):
+    """
+    Create bot's collection: named dense + BM25 sparse vectors for hybrid search.
+    Full-precision dense vectors and payloads (chunk text) on disk, quantized copy in RAM
+    (int8 scalar by default, binary if QDRANT_QUANTIZATION=binary).
+    Filter keys get keyword indexes so deletes by source stay index lookups.
+    """
+    client = get_qdrant_client()
+    collection_name = get_bot_collection_name(user_id, bot_id)
+    qdrant_config = get_qdrant_config()
+    
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={
+            DENSE_VECTOR_NAME: VectorParams(
+                size=EMBEDDING_DIMENSION,
+                distance=Distance.COSINE,
+                on_disk=True
+            )
+        },
+        sparse_vectors_config={
+            SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)  # BM25 IDF computed server-side
+        },
+        hnsw_config=HnswConfigDiff(
+            m=qdrant_config['hnsw_m'],
+            ef_construct=qdrant_config['hnsw_ef_construct'],
+            on_disk=False
+        ),
+        quantization_config=get_quantization_config(qdrant_config['quantization']),
+        on_disk_payload=True
+    )
+    for field_name in PAYLOAD_INDEX_FIELDS:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD
+        )
+    invalidate_collection_cache(collection_name)
+    logger.debug("✅ Created collection %s", collection_name)
+
 def add_documents_to_bot(user_id, bot_id, documents):
     """Add documents to bot's knowledge base"""
     try:
-        vector_store = get_vector_store(user_id, bot_id)
-        if vector_store:
-            vector_store.add_documents(documents)
-            print(f"✅ Added {len(documents)} documents to bot {bot_id}")
-            return True
-        return False
+        if not check_collection_exists(user_id, bot_id):
+            create_bot_collection(user_id, bot_id)
+        
+        client = get_qdrant_client()
+        collection_name = get_bot_collection_name(user_id, bot_id)
+        hybrid = is_hybrid_collection_cached(client, collection_name)
+        
+        # One embedding pass and one upsert per batch; payload layout matches the LangChain wrapper
+        for start in range(0, len(documents), UPSERT_BATCH_SIZE):
+            batch = documents[start:start + UPSERT_BATCH_SIZE]
+            vectors = embed_point_vectors([doc.page_content for doc in batch], hybrid)
+            client.upsert(
+                collection_name=collection_name,
+                points=[
+                    PointStruct(
+                        id=str(uuid.uuid4()),
+                        vector=vector,
+                        payload={'page_content': doc.page_content, 'metadata': doc.metadata}
+                    )
+                    for doc, vector in zip(batch, vectors)
+                ],
+                wait=False
+            )
+        
+        logger.debug("✅ Added %s documents to bot %s", len(documents), bot_id)
+        return True
     except Exception as e:
-        print(f"❌ Error adding documents: {e}")
+        logger.error("❌ Error adding documents: %s", e)
         return False
 
 def clear_bot_knowledge(user_id, bot_id):
@@ -129,10 +533,11 @@ def clear_bot_knowledge(user_id, bot_id):
         client = get_qdrant_client()
         collection_name = get_bot_collection_name(user_id, bot_id)
         client.delete_collection(collection_name=collection_name)
-        print(f"✅ Cleared knowledge base for bot {bot_id}")
+        invalidate_collection_cache(collection_name)
+        logger.debug("✅ Cleared knowledge base for bot %s", bot_id)
         return True
     except Exception as e:
-        print(f"❌ Error clearing knowledge base: {e}")
+        logger.error("❌ Error clearing knowledge base: %s", e)
         return False
 
 def remove_documents_by_source(user_id, bot_id, source_type, source_id):
@@ -157,10 +562,10 @@ def remove_documents_by_source(user_id, bot_id, source_type, source_id):
                 ]
             )
         )
-        print(f"✅ Removed documents for {source_type} source {source_id}")
+        logger.debug("✅ Removed documents for %s source %s", source_type, source_id)
         return True
     except Exception as e:
-        print(f"❌ Error removing documents by source: {e}")
+        logger.error("❌ Error removing documents by source: %s", e)
         return False
 
 def remove_documents_by_filename(user_id, bot_id, filename):
@@ -180,10 +585,72 @@ def remove_documents_by_filename(user_id, bot_id, filename):
                 ]
             )
         )
-        print(f"✅ Removed documents for filename: {filename}")
+        logger.debug("✅ Removed documents for filename: %s", filename)
+        return True
+    except Exception as e:
+        logger.error("❌ Error removing documents by filename: %s", e)
+        return False
+
+def remove_documents_by_sources(user_id, bot_id, sources):
+    """Remove documents for many (source_type, source_id) pairs in one delete call"""
+    if not sources:
+        return True
+    
+    try:
+        client = get_qdrant_client()
+        collection_name = get_bot_collection_name(user_id, bot_id)
+        
+        # OR of (source_type AND source_id) pairs - one request, one filter pass
+        client.delete(
+            collection_name=collection_name,
+            points_selector=Filter(
+                should=[
+                    Filter(
+                        must=[
+                            FieldCondition(
+                                key="metadata.source_type",
+                                match=MatchValue(value=source_type)
+                            ),
+                            FieldCondition(
+                                key="metadata.source_id",
+                                match=MatchValue(value=str(source_id))
+                            )
+                        ]
+                    )
+                    for source_type, source_id in sources
+                ]
+            )
+        )
+        logger.debug("✅ Removed documents for %s sources", len(sources))
+        return True
+    except Exception as e:
+        logger.error("❌ Error removing documents by sources: %s", e)
+        return False
+
+def remove_documents_by_filenames(user_id, bot_id, filenames):
+    """Remove documents for many filenames in one delete call"""
+    if not filenames:
+        return True
+    
+    try:
+        client = get_qdrant_client()
+        collection_name = get_bot_collection_name(user_id, bot_id)
+        
+        client.delete(
+            collection_name=collection_name,
+            points_selector=Filter(
+                must=[
+                    FieldCondition(
+                        key="metadata.source",
+                        match=MatchAny(any=list(filenames))
+                    )
+                ]
+            )
+        )
+        logger.debug("✅ Removed documents for %s filenames", len(filenames))
         return True
     except Exception as e:
-        print(f"❌ Error removing documents by filename: {e}")
+        logger.error("❌ Error removing documents by filenames: %s", e)
         return False
 
 def get_collection_info(user_id, bot_id):
@@ -195,33 +662,100 @@ def get_collection_info(user_id, bot_id):
         collection_info = client.get_collection(collection_name=collection_name)
         return {
             'points_count': collection_info.points_count,
-            'vectors_count': collection_info.vectors_count,
+            'indexed_vectors_count': collection_info.indexed_vectors_count,
             'status': collection_info.status
         }
     except Exception as e:
-        print(f"❌ Error getting collection info: {e}")
+        logger.error("❌ Error getting collection info: %s", e)
         return None
 
 def search_similar_documents(user_id, bot_id, query, k=4):
     """Search for similar documents in bot's knowledge base"""
     try:
-        vector_store = get_vector_store(user_id, bot_id)
-        if vector_store:
-            results = vector_store.similarity_search(query, k=k)
-            print(f"✅ Found {len(results)} similar documents")
-            return results
-        return []
+        embedding_model = get_embedding_model()
+        if embedding_model is None:
+            return []
+        
+        client = get_qdrant_client()
+        hybrid = is_hybrid_collection_cached(client, get_bot_collection_name(user_id, bot_id))
+        scored_documents = search_by_vector_with_score(
+            user_id, bot_id, query, embedding_model.embed_query(query), k=k, hybrid=hybrid
+        )
+        results = [doc for doc, _ in scored_documents]
+        logger.debug("✅ Found %s similar documents", len(results))
+        return results
     except Exception as e:
-        print(f"❌ Error searching documents: {e}")
+        logger.error("❌ Error searching documents: %s", e)
+        return []
+
+def point_to_document(point):
+    """Build a LangChain Document from a Qdrant point stored by the LangChain wrapper"""
+    payload = point.payload or {}
+    return Document(
+        page_content=payload.get('page_content', ''),
+        metadata=payload.get('metadata') or {}
+    )
+
+def search_by_vector_with_score(user_id, bot_id, query, vector, k=4, hybrid=False):
+    """
+    Top-k (Document, score) pairs for a query whose dense vector is already
+    computed - one Qdrant call and no second embedding pass. The query text
+    is only used for the BM25 side of hybrid collections.
+    """
+    client = get_qdrant_client()
+    collection_name = get_bot_collection_name(user_id, bot_id)
+    
+    sparse_model = get_sparse_embedding_model() if hybrid else None
+    sparse_vector = sparse_model.embed_query(query) if sparse_model else None
+    dense_vector = np.asarray(vector, dtype=np.float32).tolist()
+    
+    response = client.query_points(
+        collection_name=collection_name,
+        **build_query_kwargs(dense_vector, k, hybrid, sparse_vector)
+    )
+    return [(point_to_document(point), point.score) for point in response.points]
+
+def search_similar_documents_batch(user_id, bot_id, queries, k=4):
+    """
+    Search bot's knowledge base for several queries at once: one batched
+    embedding pass and one Qdrant request instead of one round-trip per query.
+    Returns one list of documents per query, in order.
+    """
+    if not queries:
         return []
+    
+    try:
+        client = get_qdrant_client()
+        collection_name = get_bot_collection_name(user_id, bot_id)
+        
+        hybrid = is_hybrid_collection_cached(client, collection_name)
+        
+        vectors = embed_batch(queries)
+        sparse_model = get_sparse_embedding_model() if hybrid else None
+        sparse_vectors = (
+            [sparse_model.embed_query(query) for query in queries] if sparse_model
+            else [None] * len(queries)
+        )
+        responses = client.query_batch_points(
+            collection_name=collection_name,
+            requests=[
+                build_query_request(vector, k, hybrid, sparse_vector)
+                for vector, sparse_vector in zip(vectors, sparse_vectors)
+            ]
+        )
+        results = [[point_to_document(point) for point in response.points] for response in responses]
+        logger.debug("✅ Batch search for %s queries", len(queries))
+        return results
+    except Exception as e:
+        logger.error("❌ Error batch searching documents: %s", e)
+        return [[] for _ in queries]
 
 def check_collection_exists(user_id, bot_id):
     """Check if collection exists for bot"""
     try:
         client = get_qdrant_client()
         collection_name = get_bot_collection_name(user_id, bot_id)
-        client.get_collection(collection_name=collection_name)
-        return True
+        return collection_exists_cached(client, collection_name)
     except Exception:
         return False
 
@@ -240,10 +774,10 @@ def get_collection_stats(user_id, bot_id):
             'vectors_config': str(collection_info.config.params.vectors)
         }
         
-        print(f"✅ Retrieved stats for collection {collection_name}")
+        logger.debug("✅ Retrieved stats for collection %s", collection_name)
         return stats
     except Exception as e:
-        print(f"❌ Error getting collection stats: {e}")
+        logger.error("❌ Error getting collection stats: %s", e)
         return None
 
 def create_fallback_response():